@@ -1646,11 +1646,24 @@ class DagRun(Base, LoggingMixin):
         if hook_is_noop:
 
             def create_ti_mapping(task: Operator, indexes: Iterable[int]) -> Iterator[dict[str, Any]]:
+                from airflow.task.priority_strategy import airflow_priority_weight_strategies_classes
+
                 created_counts[task.task_type] += 1
+                # The built-in weight rules only depend on the task, not on the map index, so
+                # the weight is computed once for all the expanded task instances.
+                reuse_priority_weight = type(task.weight_rule) in airflow_priority_weight_strategies_classes
+                priority_weight: int | None = None
                 for map_index in indexes:
-                    yield TI.insert_mapping(
-                        self.run_id, task, map_index=map_index, dag_version_id=dag_version_id
+                    mapping = TI.insert_mapping(
+                        self.run_id,
+                        task,
+                        map_index=map_index,
+                        dag_version_id=dag_version_id,
+                        priority_weight=priority_weight,
                     )
+                    if reuse_priority_weight:
+                        priority_weight = mapping["priority_weight"]
+                    yield mapping
 
             creator = create_ti_mapping
 
@@ -18,7 +18,6 @@
 from __future__ import annotations
 
 import contextlib
-import hashlib
 import itertools
 import logging
 import math
@@ -26,22 +25,19 @@ import operator
 import os
 import signal
 import traceback
+import zlib
 from collections import defaultdict
 from collections.abc import Collection, Generator, Iterable, Mapping, Sequence
 from datetime import timedelta
 from enum import Enum
-from functools import cache
-from pathlib import Path
+from functools import cache, cached_property, lru_cache
+from types import SimpleNamespace
 from typing import TYPE_CHECKING, Any, Callable
 from urllib.parse import quote
 
-import attrs
 import dill
-import jinja2
-import lazy_object_proxy
 import pendulum
 import uuid6
-from jinja2 import TemplateAssertionError, UndefinedError
 from sqlalchemy import (
     Column,
     Float,
@@ -71,7 +67,7 @@ from sqlalchemy.ext.associationproxy import association_proxy
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.ext.mutable import MutableDict
 from sqlalchemy.orm import lazyload, reconstructor, relationship
-from sqlalchemy.orm.attributes import NO_VALUE, set_committed_value
+from sqlalchemy.orm.attributes import NO_VALUE, instance_state, set_committed_value
 from sqlalchemy_utils import UUIDType
 
 from airflow import settings
@@ -97,13 +93,15 @@ from airflow.models.asset import AssetActive, AssetEvent, AssetModel
 from airflow.models.base import Base, StringID, TaskInstanceDependencies
 from airflow.models.dagbag import DagBag
 from airflow.models.log import Log
-from airflow.models.renderedtifields import get_serialized_template_fields
+from airflow.models.renderedtifields import RenderedTaskInstanceFields, get_serialized_template_fields
+from airflow.models.taskinstancehistory import TaskInstanceHistory
 from airflow.models.taskinstancekey import TaskInstanceKey
 from airflow.models.taskmap import TaskMap
 from airflow.models.taskreschedule import TaskReschedule
 from airflow.models.xcom import LazyXComSelectSequence, XComModel
 from airflow.plugins_manager import integrate_macros_plugins
-from airflow.sdk.execution_time.context import context_to_airflow_vars
+from airflow.sdk.execution_time.callback_runner import create_executable_runner
+from airflow.sdk.execution_time.context import context_get_outlet_events, context_to_airflow_vars
 from airflow.sentry import Sentry
 from airflow.settings import task_instance_mutation_hook
 from airflow.stats import Stats
@@ -111,7 +109,7 @@ from airflow.ti_deps.dep_context import DepContext
 from airflow.ti_deps.dependencies_deps import REQUEUEABLE_DEPS, RUNNING_DEPS
 from airflow.utils import timezone
 from airflow.utils.email import send_email
-from airflow.utils.helpers import prune_dict, render_template_to_string
+from airflow.utils.helpers import chunks, render_template_to_string
 from airflow.utils.log.logging_mixin import LoggingMixin
 from airflow.utils.net import get_hostname
 from airflow.utils.platform import getuser
@@ -134,10 +132,11 @@ if TYPE_CHECKING:
     from pathlib import PurePath
     from types import TracebackType
 
+    import jinja2
     from sqlalchemy.engine import Connection as SAConnection, Engine
     from sqlalchemy.orm.session import Session
     from sqlalchemy.sql import Update
-    from sqlalchemy.sql.elements import BooleanClauseList
+    from sqlalchemy.sql.elements import BinaryExpression, BooleanClauseList, ColumnElement
     from sqlalchemy.sql.expression import ColumnOperators
 
     from airflow.models.abstractoperator import TaskStateChangeCallback
@@ -149,9 +148,11 @@ if TYPE_CHECKING:
     from airflow.sdk.definitions.asset import AssetNameRef, AssetUniqueKey, AssetUriRef
     from airflow.sdk.definitions.dag import DAG
     from airflow.sdk.definitions.taskgroup import MappedTaskGroup
+    from airflow.sdk.execution_time.context import InletEventsAccessors
     from airflow.sdk.types import RuntimeTaskInstanceProtocol
+    from airflow.ti_deps.deps.base_ti_dep import BaseTIDep
     from airflow.typing_compat import Literal
-    from airflow.utils.context import Context
+    from airflow.utils.context import ConnectionAccessor, Context, VariableAccessor
     from airflow.utils.task_group import TaskGroup
 
 
@@ -196,6 +197,60 @@ def _update_ti_heartbeat(id: str, when: datetime, session: Session = NEW_SESSION
     session.execute(update(TaskInstance).where(TaskInstance.id == id).values(last_heartbeat_at=when))
 
 
+_TASK_FINISH_STATES: tuple[str, ...] = tuple(str(state) for state in State.task_states)
+
+# States in which ``_set_state`` stamps an end date and duration on the task instance.
+_STATES_WITH_END_DATE: frozenset[TaskInstanceState] = State.finished | {TaskInstanceState.UP_FOR_RETRY}
+
+
+def _merge_if_detached(ti: TaskInstance, session: Session) -> TaskInstance:
+    """
+    Return ``ti`` as an instance tracked by ``session``, merging it in only if it is detached.
+
+    A task instance already in the session is written by the next flush as an UPDATE of its
+    changed columns, so merging it (which may SELECT the row first) would only add a query.
+
+    :meta private:
+    """
+    if ti in session:
+        return ti
+    return session.merge(ti)
+
+
+def _refresh_from_db_on_completion(
+    ti: TaskInstance, *, session: Session, keep_local_changes: bool = False
+) -> None:
+    """
+    Refresh the task instance from the database before recording its final state.
+
+    With ``[core] skip_preempt_check_on_completion`` set, only the state is read without a row
+    lock, and the locked refresh is only done if the task instance was finished externally.
+
+    :meta private:
+    """
+    if conf.getboolean("core", "skip_preempt_check_on_completion", fallback=False):
+        state = session.scalar(select(TaskInstance.state).where(TaskInstance.id == ti.id))
+        if state not in State.finished:
+            return
+    ti.refresh_from_db(lock_for_update=True, session=session, keep_local_changes=keep_local_changes)
+
+
+@lru_cache(maxsize=1024)
+def _finish_stats_zero_init(dag_id: str, task_id: str) -> tuple[tuple[str, dict[str, str]], ...]:
+    """
+    Return the ``(stat, tags)`` pairs used to initialize the ``ti.finish`` counters at zero.
+
+    The pairs only depend on the dag and task ids, so they are built once per task rather
+    than on every run. The returned tag dicts are shared and must not be mutated.
+
+    :meta private:
+    """
+    tags = {"dag_id": dag_id, "task_id": task_id}
+    return tuple(
+        (f"ti.finish.{dag_id}.{task_id}.{state}", {**tags, "state": state}) for state in _TASK_FINISH_STATES
+    )
+
+
 def _run_raw_task(
     ti: TaskInstance,
     mark_success: bool = False,
@@ -228,28 +283,27 @@ def _run_raw_task(
     if not test_mode:
         TaskInstance.save_to_db(ti=ti, session=session)
     actual_start_date = timezone.utcnow()
-    Stats.incr(f"ti.start.{ti.task.dag_id}.{ti.task.task_id}", tags=ti.stats_tags)
+    emit_legacy_metrics = conf.getboolean("metrics", "emit_legacy_ti_metrics")
+    stats_tags = ti.stats_tags
+    dag_id, task_id = ti.task.dag_id, ti.task.task_id
+    incr = Stats.incr
+    if emit_legacy_metrics:
+        incr(f"ti.start.{dag_id}.{task_id}", tags=stats_tags)
     # Same metric with tagging
-    Stats.incr("ti.start", tags=ti.stats_tags)
+    incr("ti.start", tags=stats_tags)
     # Initialize final state counters at zero
-    for state in State.task_states:
-        Stats.incr(
-            f"ti.finish.{ti.task.dag_id}.{ti.task.task_id}.{state}",
-            count=0,
-            tags=ti.stats_tags,
-        )
+    for stat, state_tags in _finish_stats_zero_init(dag_id, task_id):
+        if emit_legacy_metrics:
+            incr(stat, count=0, tags=stats_tags)
         # Same metric with tagging
-        Stats.incr(
-            "ti.finish",
-            count=0,
-            tags={**ti.stats_tags, "state": str(state)},
-        )
+        incr("ti.finish", count=0, tags=state_tags)
     with set_current_task_instance_session(session=session):
         ti.task = ti.task.prepare_for_execution()
         context = ti.get_template_context(ignore_param_exceptions=False, session=session)
 
         try:
-            if ti.task:
+            # Most tasks declare no lineage at all, skip building the asset profiles then.
+            if ti.task and (ti.task.inlets or ti.task.outlets):
                 from airflow.sdk.definitions.asset import Asset
 
                 inlets = [asset.asprofile() for asset in ti.task.inlets if isinstance(asset, Asset)]
@@ -263,7 +317,7 @@ def _run_raw_task(
                     session=session,
                 )
             if not test_mode:
-                ti.refresh_from_db(lock_for_update=True, session=session, keep_local_changes=True)
+                _refresh_from_db_on_completion(ti, session=session, keep_local_changes=True)
             ti.state = TaskInstanceState.SUCCESS
         except TaskDeferred as defer:
             # The task has signalled it wants to defer execution based on
@@ -286,7 +340,7 @@ def _run_raw_task(
             if e.args:
                 ti.log.info(e)
             if not test_mode:
-                ti.refresh_from_db(lock_for_update=True, session=session, keep_local_changes=True)
+                _refresh_from_db_on_completion(ti, session=session, keep_local_changes=True)
             ti.state = TaskInstanceState.SKIPPED
             _run_finished_callback(callbacks=ti.task.on_skipped_callback, context=context)
             TaskInstance.save_to_db(ti=ti, session=session)
@@ -301,7 +355,7 @@ def _run_raw_task(
             raise
         except (AirflowTaskTimeout, AirflowException, AirflowTaskTerminated) as e:
             if not test_mode:
-                ti.refresh_from_db(lock_for_update=True, session=session)
+                _refresh_from_db_on_completion(ti, session=session)
             # for case when task is marked as success/failed externally
             # or dagrun timed out and task is marked as skipped
             # current behavior doesn't hit the callbacks
@@ -325,10 +379,11 @@ def _run_raw_task(
             # Print a marker post execution for internals of post task processing
             log.info("::group::Post task execution logs")
 
-            Stats.incr(
-                f"ti.finish.{ti.dag_id}.{ti.task_id}.{ti.state}",
-                tags=ti.stats_tags,
-            )
+            if emit_legacy_metrics:
+                Stats.incr(
+                    f"ti.finish.{ti.dag_id}.{ti.task_id}.{ti.state}",
+                    tags=ti.stats_tags,
+                )
             # Same metric with tagging
             Stats.incr("ti.finish", tags={**ti.stats_tags, "state": str(ti.state)})
 
@@ -346,7 +401,7 @@ def _run_raw_task(
 
         if not test_mode:
             _add_log(event=ti.state, task_instance=ti, session=session)
-            if ti.state == TaskInstanceState.SUCCESS:
+            if ti.state == TaskInstanceState.SUCCESS and ti.task.outlets:
                 from airflow.sdk.execution_time.task_runner import (
                     _build_asset_profiles,
                     _serialize_outlet_events,
@@ -405,6 +460,9 @@ def _stop_remaining_tasks(*, task_instance: TaskInstance, session: Session):
         assert task_instance.task
         assert isinstance(task_instance.task.dag, DAG)
 
+    # The task instances are attached to the session, so state changes are flushed together
+    # and running tasks are failed with a single commit rather than one commit per task.
+    forced_failure = False
     for ti in tis:
         if ti.task_id == task_instance.task_id or ti.state in (
             TaskInstanceState.SUCCESS,
@@ -415,12 +473,18 @@ def _stop_remaining_tasks(*, task_instance: TaskInstance, session: Session):
         if not task.is_teardown:
             if ti.state == TaskInstanceState.RUNNING:
                 log.info("Forcing task %s to fail due to dag's `fail_fast` setting", ti.task_id)
-                ti.error(session)
+                ti.error(session, commit=False)
+                forced_failure = True
             else:
                 log.info("Setting task %s to SKIPPED due to dag's `fail_fast` setting.", ti.task_id)
                 ti.set_state(state=TaskInstanceState.SKIPPED, session=session)
         else:
             log.info("Not skipping teardown task '%s'", ti.task_id)
+    if forced_failure:
+        session.commit()
+
+
+_CLEAR_RESCHEDULES_CHUNK_SIZE = 500
 
 
 def clear_task_instances(
@@ -444,21 +508,39 @@ def clear_task_instances(
         If set to False, DagRuns state will not be changed.
     :param dag: DAG object
     """
+    if not tis:
+        return
+
     # taskinstance uuids:
-    task_instance_ids: list[str] = []
-    dag_bag = DagBag(read_dags_from_db=True)
-    from airflow.models.taskinstancehistory import TaskInstanceHistory
+    task_instance_ids: list[str] = [ti.id for ti in tis]
+    run_ids_by_dag_id: dict[str, set[str]] = defaultdict(set)
+
+    # Resolve each distinct dag only once; the DagBag is only built if a dag other
+    # than the one passed in is needed.
+    dag_bag: DagBag | None = None
+    dags_by_id: dict[str, DAG | None] = {dag.dag_id: dag} if dag else {}
 
+    def _get_dag(dag_id: str) -> DAG | None:
+        nonlocal dag_bag
+        try:
+            return dags_by_id[dag_id]
+        except KeyError:
+            pass
+        if dag_bag is None:
+            dag_bag = DagBag(read_dags_from_db=True)
+        ti_dag = dags_by_id[dag_id] = dag_bag.get_dag(dag_id, session=session)
+        return ti_dag
+
+    TaskInstanceHistory.record_tis(tis, session)
     for ti in tis:
-        task_instance_ids.append(ti.id)
-        TaskInstanceHistory.record_ti(ti, session)
+        run_ids_by_dag_id[ti.dag_id].add(ti.run_id)
         ti.try_id = uuid7()
         if ti.state == TaskInstanceState.RUNNING:
             # If a task is cleared when running, set its state to RESTARTING so that
             # the task is terminated and becomes eligible for retry.
             ti.state = TaskInstanceState.RESTARTING
         else:
-            ti_dag = dag if dag and dag.dag_id == ti.dag_id else dag_bag.get_dag(ti.dag_id, session=session)
+            ti_dag = _get_dag(ti.dag_id)
             task_id = ti.task_id
             if ti_dag and ti_dag.has_task(task_id):
                 task = ti_dag.get_task(task_id)
@@ -475,39 +557,33 @@ def clear_task_instances(
             ti.state = None
             ti.external_executor_id = None
             ti.clear_next_method_args()
-            session.merge(ti)
+            _merge_if_detached(ti, session)
 
-    if task_instance_ids:
-        # Clear all reschedules related to the ti to clear
-        delete_qry = TR.__table__.delete().where(TR.ti_id.in_(task_instance_ids))
-        session.execute(delete_qry)
+    # Clear all reschedules related to the ti to clear. The ids are deleted in chunks
+    # so clearing a large number of tasks does not build an unbounded IN clause.
+    for task_instance_ids_chunk in chunks(task_instance_ids, _CLEAR_RESCHEDULES_CHUNK_SIZE):
+        session.execute(TR.__table__.delete().where(TR.ti_id.in_(task_instance_ids_chunk)))
 
-    if dag_run_state is not False and tis:
+    if dag_run_state is not False:
         from airflow.models.dagrun import DagRun  # Avoid circular import
 
-        run_ids_by_dag_id = defaultdict(set)
-        for instance in tis:
-            run_ids_by_dag_id[instance.dag_id].add(instance.run_id)
-
-        drs = (
-            session.query(DagRun)
-            .filter(
-                or_(
-                    and_(DagRun.dag_id == dag_id, DagRun.run_id.in_(run_ids))
-                    for dag_id, run_ids in run_ids_by_dag_id.items()
-                )
+        dag_run_state = DagRunState(dag_run_state)  # Validate the state value.
+        # Only finished runs are reset, so don't load the running ones at all.
+        drs = session.scalars(
+            select(DagRun).where(
+                tuple_(DagRun.dag_id, DagRun.run_id).in_(
+                    [(dag_id, run_id) for dag_id, run_ids in run_ids_by_dag_id.items() for run_id in run_ids]
+                ),
+                DagRun.state.in_(State.finished_dr_states),
             )
-            .all()
         )
-        dag_run_state = DagRunState(dag_run_state)  # Validate the state value.
         for dr in drs:
-            if dr.state in State.finished_dr_states:
-                dr.state = dag_run_state
-                dr.start_date = timezone.utcnow()
-                if dag_run_state == DagRunState.QUEUED:
-                    dr.last_scheduling_decision = None
-                    dr.start_date = None
-                    dr.clear_number += 1
+            dr.state = dag_run_state
+            dr.start_date = timezone.utcnow()
+            if dag_run_state == DagRunState.QUEUED:
+                dr.last_scheduling_decision = None
+                dr.start_date = None
+                dr.clear_number += 1
     session.flush()
 
 
@@ -529,6 +605,13 @@ def _xcom_pull(
     if run_id is None:
         run_id = ti.run_id
 
+    # Multi-value arguments are used both to filter and to order the result, so
+    # make sure a one-shot iterator is not exhausted by the filter.
+    if task_ids is not None and not isinstance(task_ids, str):
+        task_ids = list(task_ids)
+    if isinstance(map_indexes, Iterable) and not isinstance(map_indexes, range):
+        map_indexes = list(map_indexes)
+
     query = XComModel.get_many(
         key=key,
         run_id=run_id,
@@ -559,24 +642,10 @@ def _xcom_pull(
 
     # At this point either task_ids or map_indexes is explicitly multi-value.
     # Order return values to match task_ids and map_indexes ordering.
-    ordering = []
-    if task_ids is None or isinstance(task_ids, str):
-        ordering.append(XComModel.task_id)
-    elif task_id_whens := {tid: i for i, tid in enumerate(task_ids)}:
-        ordering.append(case(task_id_whens, value=XComModel.task_id))
-    else:
-        ordering.append(XComModel.task_id)
-    if map_indexes is None or isinstance(map_indexes, int):
-        ordering.append(XComModel.map_index)
-    elif isinstance(map_indexes, range):
-        order = XComModel.map_index
-        if map_indexes.step < 0:
-            order = order.desc()
-        ordering.append(order)
-    elif map_index_whens := {map_index: i for i, map_index in enumerate(map_indexes)}:
-        ordering.append(case(map_index_whens, value=XComModel.map_index))
-    else:
-        ordering.append(XComModel.map_index)
+    ordering = [
+        _xcom_pull_ordering("task_id", task_ids),
+        _xcom_pull_ordering("map_index", map_indexes),
+    ]
     return LazyXComSelectSequence.from_select(
         query.with_entities(XComModel.value).order_by(None).statement,
         order_by=ordering,
@@ -584,6 +653,38 @@ def _xcom_pull(
     )
 
 
+def _xcom_pull_ordering(
+    column_name: Literal["task_id", "map_index"], values: str | int | Sequence | None
+) -> ColumnElement:
+    """
+    Return the ORDER BY clause matching the order of the values pulled for a column.
+
+    A ``CASE`` expression is only needed when more than one explicitly ordered value is requested.
+
+    :meta private:
+    """
+    column = getattr(XComModel, column_name)
+    if values is None or isinstance(values, (str, int)):
+        return column
+    if isinstance(values, range):
+        return column.desc() if values.step < 0 else column
+    if len(values) > 1:
+        return _xcom_pull_case_ordering(column_name, tuple(values))
+    return column
+
+
+@lru_cache(maxsize=32)
+def _xcom_pull_case_ordering(column_name: Literal["task_id", "map_index"], values: tuple) -> ColumnElement:
+    """
+    Build the ``CASE`` ordering for a column, reused for repeated pulls of the same values.
+
+    The cache is kept small since each entry holds on to the requested values.
+
+    :meta private:
+    """
+    return case({value: i for i, value in enumerate(values)}, value=getattr(XComModel, column_name))
+
+
 def _creator_note(val):
     """Creator the ``note`` association proxy."""
     if isinstance(val, str):
@@ -639,9 +740,6 @@ def _execute_task(task_instance: TaskInstance, context: Context, task_orig: Oper
             )
 
     def _execute_callable(context: Context, **execute_callable_kwargs):
-        from airflow.sdk.execution_time.callback_runner import create_executable_runner
-        from airflow.sdk.execution_time.context import context_get_outlet_events
-
         try:
             # Print a marker for log grouping of details before task execution
             log.info("::endgroup::")
@@ -738,7 +836,7 @@ def _stats_tags(*, task_instance: TaskInstance) -> dict[str, str]:
 
     :meta private:
     """
-    return prune_dict({"dag_id": task_instance.dag_id, "task_id": task_instance.task_id})
+    return {"dag_id": task_instance.dag_id, "task_id": task_instance.task_id}
 
 
 def _clear_next_method_args(*, task_instance: TaskInstance) -> None:
@@ -755,6 +853,36 @@ def _clear_next_method_args(*, task_instance: TaskInstance) -> None:
     task_instance.next_kwargs = None
 
 
+@cache
+def _get_template_accessors() -> tuple[VariableAccessor, VariableAccessor, ConnectionAccessor]:
+    """
+    Return the variable and connection accessors shared by all template contexts.
+
+    The accessors are stateless, so one instance of each is enough per process.
+
+    :meta private:
+    """
+    from airflow.utils.context import ConnectionAccessor, VariableAccessor
+
+    return (
+        VariableAccessor(deserialize_json=True),
+        VariableAccessor(deserialize_json=False),
+        ConnectionAccessor(),
+    )
+
+
+@cache
+def _get_empty_inlet_events() -> InletEventsAccessors:
+    """
+    Return the inlet events accessor shared by all tasks without inlets.
+
+    :meta private:
+    """
+    from airflow.sdk.execution_time.context import InletEventsAccessors
+
+    return InletEventsAccessors([])
+
+
 def _get_template_context(
     *,
     task_instance: TaskInstance,
@@ -776,6 +904,8 @@ def _get_template_context(
     if not session:
         session = settings.Session()
 
+    import lazy_object_proxy
+
     from airflow import macros
     from airflow.models.abstractoperator import NotMapped
     from airflow.models.baseoperator import BaseOperator
@@ -786,11 +916,7 @@ def _get_template_context(
     )
     from airflow.sdk.definitions.param import process_params
     from airflow.sdk.execution_time.context import InletEventsAccessors
-    from airflow.utils.context import (
-        ConnectionAccessor,
-        OutletEventAccessors,
-        VariableAccessor,
-    )
+    from airflow.utils.context import OutletEventAccessors
 
     integrate_macros_plugins()
 
@@ -808,14 +934,19 @@ def _get_template_context(
         # The dag_run may not be attached to the session anymore since the
         # code base is over-zealous with use of session.expunge_all().
         # Re-attach it if the relation is not loaded so we can load it when needed.
-        info = inspect(dag_run)
-        if info.attrs.consumed_asset_events.loaded_value is not NO_VALUE:
+        # Loaded attributes live in the instance __dict__, which is cheaper to probe than
+        # going through the inspection API.
+        if "consumed_asset_events" in dag_run.__dict__:
             return dag_run
+        info = instance_state(dag_run)
         # If dag_run is not flushed to db at all (e.g. CLI commands using
         # in-memory objects for ad-hoc operations), just set the value manually.
         if not info.has_identity:
             dag_run.consumed_asset_events = []
             return dag_run
+        # If the session already holds this dag run, use it instead of paying for a merge.
+        if (attached := session.identity_map.get(info.identity_key)) is not None:
+            return attached
         return session.merge(dag_run, load=False)
 
     dag_run = _get_dagrun(session)
@@ -834,7 +965,13 @@ def _get_template_context(
     def _get_previous_dagrun_success() -> PrevSuccessfulDagRunResponse:
         dr_from_db = task_instance.get_previous_dagrun(state=DagRunState.SUCCESS, session=session)
         if dr_from_db:
-            return PrevSuccessfulDagRunResponse.model_validate(dr_from_db, from_attributes=True)
+            # The dates come straight from UtcDateTime columns, so they need no validation.
+            return PrevSuccessfulDagRunResponse.model_construct(
+                data_interval_start=dr_from_db.data_interval_start,
+                data_interval_end=dr_from_db.data_interval_end,
+                start_date=dr_from_db.start_date,
+                end_date=dr_from_db.end_date,
+            )
         return PrevSuccessfulDagRunResponse()
 
     def get_prev_data_interval_start_success() -> pendulum.DateTime | None:
@@ -858,6 +995,8 @@ def _get_template_context(
 
         return triggering_events
 
+    variable_json_accessor, variable_value_accessor, connection_accessor = _get_template_accessors()
+
     # NOTE: If you add to this dict, make sure to also update the following:
     # * Context in task-sdk/src/airflow/sdk/definitions/context.py
     # * KNOWN_CONTEXT_KEYS in airflow/utils/context.py
@@ -866,23 +1005,23 @@ def _get_template_context(
     context.update(
         {
             "outlet_events": OutletEventAccessors(),
-            "inlet_events": InletEventsAccessors(task.inlets),
+            "inlet_events": InletEventsAccessors(task.inlets) if task.inlets else _get_empty_inlet_events(),
             "macros": macros,
             "params": validated_params,
-            "prev_data_interval_start_success": get_prev_data_interval_start_success(),
-            "prev_data_interval_end_success": get_prev_data_interval_end_success(),
-            "prev_start_date_success": get_prev_start_date_success(),
-            "prev_end_date_success": get_prev_end_date_success(),
+            "prev_data_interval_start_success": lazy_object_proxy.Proxy(get_prev_data_interval_start_success),
+            "prev_data_interval_end_success": lazy_object_proxy.Proxy(get_prev_data_interval_end_success),
+            "prev_start_date_success": lazy_object_proxy.Proxy(get_prev_start_date_success),
+            "prev_end_date_success": lazy_object_proxy.Proxy(get_prev_end_date_success),
             "test_mode": task_instance.test_mode,
             # ti/task_instance are added here for ti.xcom_{push,pull}
             "task_instance": task_instance,
             "ti": task_instance,
             "triggering_asset_events": lazy_object_proxy.Proxy(get_triggering_events),
             "var": {
-                "json": VariableAccessor(deserialize_json=True),
-                "value": VariableAccessor(deserialize_json=False),
+                "json": variable_json_accessor,
+                "value": variable_value_accessor,
             },
-            "conn": ConnectionAccessor(),
+            "conn": connection_accessor,
         }
     )
 
@@ -895,14 +1034,11 @@ def _get_template_context(
             setattr(
                 task_instance,
                 "_upstream_map_indexes",
-                {
-                    upstream.task_id: task_instance.get_relevant_upstream_map_indexes(
-                        upstream,
-                        expanded_ti_count,
-                        session=session,
-                    )
-                    for upstream in task.upstream_list
-                },
+                task_instance.get_relevant_upstream_map_indexes_bulk(
+                    task.upstream_list,
+                    expanded_ti_count,
+                    session=session,
+                ),
             )
     except NotMapped:
         pass
@@ -1164,6 +1300,43 @@ def _email_alert(*, task_instance: TaskInstance, exception, task: BaseOperator)
         send_email(task.email, subject, html_content_err)
 
 
+_DEFAULT_EMAIL_SUBJECT = "Airflow alert: {{ti}}"
+# For reporting purposes, we report based on 1-indexed,
+# not 0-indexed lists (i.e. Try 1 instead of
+# Try 0 for the first attempt).
+_DEFAULT_EMAIL_HTML_CONTENT = (
+    "Try {{try_number}} out of {{max_tries + 1}}<br>"
+    "Exception:<br>{{exception_html}}<br>"
+    'Log: <a href="{{ti.log_url}}">Link</a><br>'
+    "Host: {{ti.hostname}}<br>"
+    'Mark success: <a href="{{ti.mark_success_url}}">Link</a><br>'
+)
+_DEFAULT_EMAIL_HTML_CONTENT_ERR = (
+    "Try {{try_number}} out of {{max_tries + 1}}<br>"
+    "Exception:<br>Failed attempt to attach error logs<br>"
+    'Log: <a href="{{ti.log_url}}">Link</a><br>'
+    "Host: {{ti.hostname}}<br>"
+    'Mark success: <a href="{{ti.mark_success_url}}">Link</a><br>'
+)
+
+
+@cache
+def _get_default_email_templates() -> tuple[jinja2.Template, jinja2.Template, jinja2.Template]:
+    """
+    Compile the default email templates once per process.
+
+    :meta private:
+    """
+    import jinja2
+
+    jinja_env = jinja2.Environment(loader=jinja2.FileSystemLoader(os.path.dirname(__file__)), autoescape=True)
+    return (
+        jinja_env.from_string(_DEFAULT_EMAIL_SUBJECT),
+        jinja_env.from_string(_DEFAULT_EMAIL_HTML_CONTENT),
+        jinja_env.from_string(_DEFAULT_EMAIL_HTML_CONTENT_ERR),
+    )
+
+
 def _get_email_subject_content(
     *,
     task_instance: TaskInstance | RuntimeTaskInstanceProtocol,
@@ -1185,26 +1358,6 @@ def _get_email_subject_content(
     use_default = task is None
     exception_html = str(exception).replace("\n", "<br>")
 
-    default_subject = "Airflow alert: {{ti}}"
-    # For reporting purposes, we report based on 1-indexed,
-    # not 0-indexed lists (i.e. Try 1 instead of
-    # Try 0 for the first attempt).
-    default_html_content = (
-        "Try {{try_number}} out of {{max_tries + 1}}<br>"
-        "Exception:<br>{{exception_html}}<br>"
-        'Log: <a href="{{ti.log_url}}">Link</a><br>'
-        "Host: {{ti.hostname}}<br>"
-        'Mark success: <a href="{{ti.mark_success_url}}">Link</a><br>'
-    )
-
-    default_html_content_err = (
-        "Try {{try_number}} out of {{max_tries + 1}}<br>"
-        "Exception:<br>Failed attempt to attach error logs<br>"
-        'Log: <a href="{{ti.log_url}}">Link</a><br>'
-        "Host: {{ti.hostname}}<br>"
-        'Mark success: <a href="{{ti.mark_success_url}}">Link</a><br>'
-    )
-
     additional_context: dict[str, Any] = {
         "exception": exception,
         "exception_html": exception_html,
@@ -1214,12 +1367,10 @@ def _get_email_subject_content(
 
     if use_default:
         default_context = {"ti": task_instance, **additional_context}
-        jinja_env = jinja2.Environment(
-            loader=jinja2.FileSystemLoader(os.path.dirname(__file__)), autoescape=True
-        )
-        subject = jinja_env.from_string(default_subject).render(**default_context)
-        html_content = jinja_env.from_string(default_html_content).render(**default_context)
-        html_content_err = jinja_env.from_string(default_html_content_err).render(**default_context)
+        subject_template, html_content_template, html_content_err_template = _get_default_email_templates()
+        subject = subject_template.render(**default_context)
+        html_content = html_content_template.render(**default_context)
+        html_content_err = html_content_err_template.render(**default_context)
 
     else:
         from airflow.sdk.definitions._internal.templater import SandboxedEnvironment
@@ -1251,9 +1402,9 @@ def _get_email_subject_content(
                     log.exception("Error while using email template %s. Using defaults...", path)
             return render_template_to_string(jinja_env.from_string(content), jinja_context)
 
-        subject = render("subject_template", default_subject)
-        html_content = render("html_content_template", default_html_content)
-        html_content_err = render("html_content_template", default_html_content_err)
+        subject = render("subject_template", _DEFAULT_EMAIL_SUBJECT)
+        html_content = render("html_content_template", _DEFAULT_EMAIL_HTML_CONTENT)
+        html_content_err = render("html_content_template", _DEFAULT_EMAIL_HTML_CONTENT_ERR)
 
     return subject, html_content, html_content_err
 
@@ -1272,17 +1423,11 @@ def _run_finished_callback(
     :meta private:
     """
     if callbacks:
-        callbacks = callbacks if isinstance(callbacks, Sequence) else [callbacks]
-
-        def get_callback_representation(callback: TaskStateChangeCallback) -> Any:
-            with contextlib.suppress(AttributeError):
-                return callback.__name__
-            with contextlib.suppress(AttributeError):
-                return callback.__class__.__name__
-            return callback
+        callbacks = callbacks if isinstance(callbacks, Sequence) else (callbacks,)
 
         for idx, callback in enumerate(callbacks):
-            callback_repr = get_callback_representation(callback)
+            # Callable instances and partials have no __name__, fall back to their class name.
+            callback_repr = getattr(callback, "__name__", type(callback).__name__)
             log.info("Executing callback at index %d: %s", idx, callback_repr)
             try:
                 callback(context)
@@ -1290,6 +1435,16 @@ def _run_finished_callback(
                 log.exception("Error in callback at index %d: %s", idx, callback_repr)
 
 
+_LOG_DATE_FORMAT = "%Y%m%dT%H%M%S"
+_LOG_STATE_MESSAGE = (
+    "%sMarking task as %s. dag_id=%s, task_id=%s, run_id=%s, logical_date=%s, start_date=%s, end_date=%s"
+)
+_LOG_STATE_MAPPED_MESSAGE = (
+    "%sMarking task as %s. dag_id=%s, task_id=%s, run_id=%s, map_index=%d, "
+    "logical_date=%s, start_date=%s, end_date=%s"
+)
+
+
 def _log_state(*, task_instance: TaskInstance, lead_msg: str = "") -> None:
     """
     Log task state.
@@ -1299,6 +1454,8 @@ def _log_state(*, task_instance: TaskInstance, lead_msg: str = "") -> None:
 
     :meta private:
     """
+    if not log.isEnabledFor(logging.INFO):
+        return
     params = [
         lead_msg,
         str(task_instance.state).upper(),
@@ -1306,17 +1463,20 @@ def _log_state(*, task_instance: TaskInstance, lead_msg: str = "") -> None:
         task_instance.task_id,
         task_instance.run_id,
     ]
-    message = "%sMarking task as %s. dag_id=%s, task_id=%s, run_id=%s, "
     if task_instance.map_index >= 0:
         params.append(task_instance.map_index)
-        message += "map_index=%d, "
-    message += "logical_date=%s, start_date=%s, end_date=%s"
+        message = _LOG_STATE_MAPPED_MESSAGE
+    else:
+        message = _LOG_STATE_MESSAGE
+    logical_date = task_instance.logical_date
+    start_date = task_instance.start_date
+    end_date = task_instance.end_date
     log.info(
         message,
         *params,
-        _date_or_empty(task_instance=task_instance, attr="logical_date"),
-        _date_or_empty(task_instance=task_instance, attr="start_date"),
-        _date_or_empty(task_instance=task_instance, attr="end_date"),
+        logical_date.strftime(_LOG_DATE_FORMAT) if logical_date else "",
+        start_date.strftime(_LOG_DATE_FORMAT) if start_date else "",
+        end_date.strftime(_LOG_DATE_FORMAT) if end_date else "",
         stacklevel=2,
     )
 
@@ -1331,7 +1491,7 @@ def _date_or_empty(*, task_instance: TaskInstance, attr: str) -> str:
     :meta private:
     """
     result: datetime | None = getattr(task_instance, attr, None)
-    return result.strftime("%Y%m%dT%H%M%S") if result else ""
+    return result.strftime(_LOG_DATE_FORMAT) if result else ""
 
 
 def _get_previous_ti(
@@ -1357,12 +1517,13 @@ def _get_previous_ti(
 
 @provide_session
 def _update_rtif(ti, rendered_fields, session: Session = NEW_SESSION):
-    from airflow.models.renderedtifields import RenderedTaskInstanceFields
-
     rtif = RenderedTaskInstanceFields(ti=ti, render_templates=False, rendered_fields=rendered_fields)
     RenderedTaskInstanceFields.write(rtif, session=session)
     session.flush()
-    RenderedTaskInstanceFields.delete_old_records(ti.task_id, ti.dag_id, session=session)
+    # There is one row per task instance, and a retry overwrites the row of an earlier try, which
+    # does not change how many rows are kept for the task. So only the first try needs to prune.
+    if ti.try_number <= 1:
+        RenderedTaskInstanceFields.delete_old_records(ti.task_id, ti.dag_id, session=session)
 
 
 @provide_session
@@ -1485,6 +1646,45 @@ def _handle_reschedule(
     return ti
 
 
+@cache
+def _get_unixname() -> str:
+    """
+    Return the name of the user running this process, looked up once per process.
+
+    :meta private:
+    """
+    return getuser()
+
+
+def _get_scheduler_deps(task: Operator) -> frozenset[BaseTIDep]:
+    """
+    Return the scheduler dependencies of a task which does not define ``deps`` itself.
+
+    :meta private:
+    """
+    return _scheduler_deps(getattr(task, "_is_sensor", False))
+
+
+@cache
+def _scheduler_deps(is_sensor: bool) -> frozenset[BaseTIDep]:
+    """
+    Return the dependencies a task gets after a serialization round trip.
+
+    Deserialization only sets ``deps`` from the ``_is_sensor`` flag, on top of the
+    ``SerializedBaseOperator`` defaults, so the result does not depend on the operator class.
+
+    :meta private:
+    """
+    from airflow.serialization.serialized_objects import SerializedBaseOperator
+
+    if not is_sensor:
+        return SerializedBaseOperator.deps
+
+    from airflow.ti_deps.deps.ready_to_reschedule import ReadyToRescheduleDep
+
+    return SerializedBaseOperator.deps | {ReadyToRescheduleDep()}
+
+
 def uuid7() -> str:
     """Generate a new UUID7 string."""
     return str(uuid6.uuid7())
@@ -1649,7 +1849,7 @@ class TaskInstance(Base, LoggingMixin):
         self.max_tries = self.task.retries
         if not self.id:
             self.id = uuid7()
-        self.unixname = getuser()
+        self.unixname = _get_unixname()
         if state:
             self.state = state
         self.hostname = ""
@@ -1661,25 +1861,53 @@ class TaskInstance(Base, LoggingMixin):
         self.context_carrier = {}
 
     def __hash__(self):
-        return hash((self.task_id, self.dag_id, self.run_id, self.map_index))
+        # Task instances compare by identity, so the hash only has to be stable for the
+        # lifetime of the object and can be computed once.
+        try:
+            return self._hash
+        except AttributeError:
+            self._hash = hash((self.task_id, self.dag_id, self.run_id, self.map_index))
+            return self._hash
 
-    @property
+    @cached_property
     def stats_tags(self) -> dict[str, str]:
-        """Returns task instance tags."""
+        """
+        Returns task instance tags.
+
+        The tags only depend on the (immutable) dag and task ids, so they are built once per instance.
+        The returned dict is shared, copy it before adding tags.
+        """
         return _stats_tags(task_instance=self)
 
     @staticmethod
     def insert_mapping(
-        run_id: str, task: Operator, map_index: int, dag_version_id: UUIDType | None
+        run_id: str,
+        task: Operator,
+        map_index: int,
+        dag_version_id: UUIDType | None,
+        *,
+        priority_weight: int | None = None,
     ) -> dict[str, Any]:
         """
         Insert mapping.
 
+        :param priority_weight: Precomputed priority weight of the task instance. If not
+            given, it is computed from the task's weight rule.
+
         :meta private:
         """
-        priority_weight = task.weight_rule.get_weight(
-            TaskInstance(task=task, run_id=run_id, map_index=map_index)
-        )
+        if priority_weight is None:
+            from airflow.task.priority_strategy import airflow_priority_weight_strategies_classes
+
+            if type(task.weight_rule) in airflow_priority_weight_strategies_classes:
+                # The built-in weight rules only read ``ti.task``, so there is no need to build
+                # (and throw away) a full task instance for them.
+                ti_for_weight: Any = SimpleNamespace(
+                    dag_id=task.dag_id, task_id=task.task_id, run_id=run_id, map_index=map_index, task=task
+                )
+            else:
+                ti_for_weight = TaskInstance(task=task, run_id=run_id, map_index=map_index)
+            priority_weight = task.weight_rule.get_weight(ti_for_weight)
 
         return {
             "dag_id": task.dag_id,
@@ -1687,7 +1915,7 @@ class TaskInstance(Base, LoggingMixin):
             "run_id": run_id,
             "try_number": 0,
             "hostname": "",
-            "unixname": getuser(),
+            "unixname": _get_unixname(),
             "queue": task.queue,
             "pool": task.pool,
             "pool_slots": task.pool_slots,
@@ -1786,13 +2014,9 @@ class TaskInstance(Base, LoggingMixin):
         if dag is None:
             raise ValueError("DagModel is empty")
 
-        path = None
-        if dag.relative_fileloc:
-            path = Path(dag.relative_fileloc)
-
-        if path:
-            if not path.is_absolute():
-                path = "DAGS_FOLDER" / path
+        path = dag.relative_fileloc or None
+        if path and not os.path.isabs(path):
+            path = os.path.join("DAGS_FOLDER", path)
 
         return TaskInstance.generate_command(
             ti.dag_id,
@@ -1886,23 +2110,23 @@ class TaskInstance(Base, LoggingMixin):
         """
         cmd = ["airflow", "tasks", "run", dag_id, task_id, run_id]
         if mark_success:
-            cmd.extend(["--mark-success"])
+            cmd.append("--mark-success")
         if ignore_all_deps:
-            cmd.extend(["--ignore-all-dependencies"])
+            cmd.append("--ignore-all-dependencies")
         if ignore_task_deps:
-            cmd.extend(["--ignore-dependencies"])
+            cmd.append("--ignore-dependencies")
         if ignore_depends_on_past:
             cmd.extend(["--depends-on-past", "ignore"])
         elif wait_for_past_depends_before_skipping:
             cmd.extend(["--depends-on-past", "wait"])
         if ignore_ti_state:
-            cmd.extend(["--force"])
+            cmd.append("--force")
         if local:
-            cmd.extend(["--local"])
+            cmd.append("--local")
         if pool:
             cmd.extend(["--pool", pool])
         if raw:
-            cmd.extend(["--raw"])
+            cmd.append("--raw")
         if file_path:
             cmd.extend(["--subdir", os.fspath(file_path)])
         if cfg_path:
@@ -1917,7 +2141,11 @@ class TaskInstance(Base, LoggingMixin):
         run_id = quote(self.run_id)
         base_url = conf.get_mandatory_value("webserver", "BASE_URL")
         map_index = f"&map_index={self.map_index}" if self.map_index >= 0 else ""
-        _log_uri = (
+        logical_date = self.logical_date
+        base_date = (
+            f"&base_date={quote(logical_date.strftime('%Y-%m-%dT%H:%M:%S%z'))}" if logical_date else ""
+        )
+        return (
             f"{base_url}"
             f"/dags"
             f"/{self.dag_id}"
@@ -1926,11 +2154,8 @@ class TaskInstance(Base, LoggingMixin):
             f"&task_id={self.task_id}"
             f"{map_index}"
             "&tab=logs"
+            f"{base_date}"
         )
-        if self.logical_date:
-            base_date = quote(self.logical_date.strftime("%Y-%m-%dT%H:%M:%S%z"))
-            _log_uri = f"{_log_uri}&base_date={base_date}"
-        return _log_uri
 
     @property
     def mark_success_url(self) -> str:
@@ -1955,25 +2180,23 @@ class TaskInstance(Base, LoggingMixin):
         If a session is passed, we use and looking up the state becomes part of the session,
         otherwise a new session is used.
 
-        sqlalchemy.inspect is used here to get the primary keys ensuring that if they change
-        it will not regress
-
         :param session: SQLAlchemy ORM Session
         """
-        filters = (col == getattr(self, col.name) for col in inspect(TaskInstance).primary_key)
-        return session.query(TaskInstance.state).filter(*filters).scalar()
+        return session.scalar(select(TaskInstance.state).where(TaskInstance.id == self.id))
 
     @provide_session
-    def error(self, session: Session = NEW_SESSION) -> None:
+    def error(self, session: Session = NEW_SESSION, commit: bool = True) -> None:
         """
         Force the task instance's state to FAILED in the database.
 
         :param session: SQLAlchemy ORM Session
+        :param commit: whether to commit the session; pass False to leave that to the caller
         """
         self.log.error("Recording the task instance as FAILED")
         self.state = TaskInstanceState.FAILED
         session.merge(self)
-        session.commit()
+        if commit:
+            session.commit()
 
     @classmethod
     @provide_session
@@ -2029,22 +2252,22 @@ class TaskInstance(Base, LoggingMixin):
             session=session,
         )
         if source:
-            from sqlalchemy.orm import attributes
-
             source_state = inspect(source)
             if source_state is None:
                 raise RuntimeError(f"Unable to inspect SQLAlchemy state of {type(source)}: {source}")
             target_state = inspect(self)
             if target_state is None:
                 raise RuntimeError(f"Unable to inspect SQLAlchemy state of {type(self)}: {self}")
-            for name, attr in source_state.attrs.items():
+            # Only the attributes loaded on the source are copied; reading them straight from the
+            # instance dict avoids building an AttributeState for each of the mapped attributes.
+            loaded = source_state.dict
+            for prop in source_state.mapper.attrs:
+                name = prop.key
+                if name not in loaded:
+                    continue
                 if keep_local_changes and target_state.attrs[name].history.has_changes():
                     continue
-
-                val = attr.loaded_value
-
-                if val is not attributes.NO_VALUE:
-                    set_committed_value(self, name, val)
+                set_committed_value(self, name, loaded[name])
 
             target_state.key = source_state.key
         else:
@@ -2098,7 +2321,9 @@ class TaskInstance(Base, LoggingMixin):
     def _set_state(ti: TaskInstance, state, session: Session) -> bool:
         if not isinstance(ti, TaskInstance):
             ti = session.scalars(
-                select(TaskInstance).where(
+                select(TaskInstance)
+                .options(lazyload(TaskInstance.dag_run))  # only the state is updated, no need to join dag run
+                .where(
                     TaskInstance.task_id == ti.task_id,
                     TaskInstance.dag_id == ti.dag_id,
                     TaskInstance.run_id == ti.run_id,
@@ -2113,11 +2338,11 @@ class TaskInstance(Base, LoggingMixin):
         ti.log.debug("Setting task state for %s to %s", ti, state)
         ti.state = state
         ti.start_date = ti.start_date or current_time
-        if ti.state in State.finished or ti.state == TaskInstanceState.UP_FOR_RETRY:
+        if state in _STATES_WITH_END_DATE:
             ti.end_date = ti.end_date or current_time
             ti.duration = (ti.end_date - ti.start_date).total_seconds()
 
-        session.merge(ti)
+        _merge_if_detached(ti, session)
         return True
 
     @provide_session
@@ -2261,12 +2486,7 @@ class TaskInstance(Base, LoggingMixin):
         if not hasattr(self.task, "deps"):
             # These deps are not on BaseOperator since they are only needed and evaluated
             # in the scheduler and not needed at the Runtime.
-            from airflow.serialization.serialized_objects import SerializedBaseOperator
-
-            serialized_op = SerializedBaseOperator.deserialize_operator(
-                SerializedBaseOperator.serialize_operator(self.task)
-            )
-            setattr(self.task, "deps", serialized_op.deps)  # type: ignore[union-attr]
+            setattr(self.task, "deps", _get_scheduler_deps(self.task))  # type: ignore[union-attr]
 
         dep_context = dep_context or DepContext()
         for dep in dep_context.deps | self.task.deps:
@@ -2312,13 +2532,13 @@ class TaskInstance(Base, LoggingMixin):
             if min_backoff < 1:
                 min_backoff = 1
 
-            # deterministic per task instance
-            ti_hash = int(
-                hashlib.sha1(
-                    f"{self.dag_id}#{self.task_id}#{self.logical_date}#{self.try_number}".encode(),
-                    usedforsecurity=False,
-                ).hexdigest(),
-                16,
+            # deterministic per task instance, the hash is only used to spread retries out.
+            # This used to be a SHA-1 of the same string: the delay picked for a given task instance
+            # (still within the same range) changed with the switch to crc32, including for task
+            # instances already waiting to retry at upgrade time. test_next_retry_datetime_pinned_values
+            # pins the values, so any further change here must be deliberate.
+            ti_hash = zlib.crc32(
+                f"{self.dag_id}#{self.task_id}#{self.logical_date}#{self.try_number}".encode()
             )
             # between 1 and 1.0 * delay * (2^retry_number)
             modded_hash = min_backoff + ti_hash % min_backoff
@@ -2378,9 +2598,9 @@ class TaskInstance(Base, LoggingMixin):
         if TYPE_CHECKING:
             assert task_instance.task
         if task_instance.task.dag is None:
-            task_instance.task.dag = DagBag(read_dags_from_db=True).get_dag(
-                dag_id=task_instance.dag_id, session=session
-            )
+            from airflow.models.serialized_dag import SerializedDagModel
+
+            task_instance.task.dag = SerializedDagModel.get_dag(dag_id=task_instance.dag_id, session=session)
         if TYPE_CHECKING:
             assert task_instance.task.dag
         return task_instance.task.dag
@@ -2493,7 +2713,7 @@ class TaskInstance(Base, LoggingMixin):
                     ti.max_tries + 1,
                 )
                 ti.queued_dttm = timezone.utcnow()
-                session.merge(ti)
+                _merge_if_detached(ti, session)
                 session.commit()
                 return False
 
@@ -2513,7 +2733,7 @@ class TaskInstance(Base, LoggingMixin):
 
         ti.end_date = None
         if not test_mode:
-            session.merge(ti).task = task
+            _merge_if_detached(ti, session).task = task
         session.commit()
 
         # Closing all pooled connections to prevent
@@ -2654,6 +2874,10 @@ class TaskInstance(Base, LoggingMixin):
         outlet_events: list[dict[str, Any]],
         session: Session = NEW_SESSION,
     ) -> None:
+        if not task_outlets:
+            # Nothing to register; this is the case for most tasks reporting success.
+            return
+
         from airflow.sdk.definitions.asset import Asset, AssetAlias, AssetNameRef, AssetUniqueKey, AssetUriRef
 
         asset_keys = {
@@ -2668,91 +2892,91 @@ class TaskInstance(Base, LoggingMixin):
             Asset.ref(uri=o.uri) for o in task_outlets if o.type == AssetUriRef.__name__ and o.uri
         }
 
-        asset_models: dict[AssetUniqueKey, AssetModel] = {
-            AssetUniqueKey.from_asset(am): am
-            for am in session.scalars(
-                select(AssetModel).where(
-                    AssetModel.active.has(),
-                    or_(
-                        tuple_(AssetModel.name, AssetModel.uri).in_(attrs.astuple(k) for k in asset_keys),
-                        AssetModel.name.in_(r.name for r in asset_name_refs),
-                        AssetModel.uri.in_(r.uri for r in asset_uri_refs),
-                    ),
-                )
+        # Only match on the kinds of reference the task actually has, so the query does not
+        # carry empty IN clauses, and is skipped entirely if the task only has alias outlets.
+        asset_model_filters: list[ColumnOperators] = []
+        if asset_keys:
+            asset_model_filters.append(
+                tuple_(AssetModel.name, AssetModel.uri).in_([(k.name, k.uri) for k in asset_keys])
             )
-        }
+        if asset_name_refs:
+            asset_model_filters.append(AssetModel.name.in_([r.name for r in asset_name_refs]))
+        if asset_uri_refs:
+            asset_model_filters.append(AssetModel.uri.in_([r.uri for r in asset_uri_refs]))
+
+        # Only the keys are needed: the asset manager looks each asset up again by name and uri.
+        active_asset_keys: set[AssetUniqueKey] = set()
+        if asset_model_filters:
+            active_asset_keys = {
+                AssetUniqueKey(name, uri)
+                for name, uri in session.execute(
+                    select(AssetModel.name, AssetModel.uri).where(
+                        AssetModel.active.has(), or_(*asset_model_filters)
+                    )
+                )
+            }
 
-        asset_event_extras: dict[AssetUniqueKey, dict] = {
-            AssetUniqueKey(**event["dest_asset_key"]): event["extra"]
-            for event in outlet_events
-            if "source_alias_name" not in event
-        }
+        # Split the outlet events in a single pass: events emitted directly for an asset, and
+        # events emitted through one of the task's asset aliases.
+        outlet_alias_names = {o.name for o in task_outlets if o.type == AssetAlias.__name__ and o.name}
+        asset_event_extras: dict[AssetUniqueKey, dict] = {}
+        event_extras_from_aliases: dict[tuple[AssetUniqueKey, frozenset], set[str]] = defaultdict(set)
+        for event in outlet_events:
+            alias_name = event.get("source_alias_name")
+            if alias_name is None:
+                asset_event_extras[AssetUniqueKey(**event["dest_asset_key"])] = event["extra"]
+            elif alias_name in outlet_alias_names:
+                asset_key = AssetUniqueKey(**event["dest_asset_key"])
+                event_extras_from_aliases[asset_key, frozenset(event["extra"].items())].add(alias_name)
 
         bad_asset_keys: set[AssetUniqueKey | AssetNameRef | AssetUriRef] = set()
 
         for key in asset_keys:
-            try:
-                am = asset_models[key]
-            except KeyError:
+            if key not in active_asset_keys:
                 bad_asset_keys.add(key)
                 continue
-            ti.log.debug("register event for asset %s", am)
+            ti.log.debug("register event for asset %s", key)
             asset_manager.register_asset_change(
                 task_instance=ti,
-                asset=am,
+                asset=key,
                 extra=asset_event_extras.get(key),
                 session=session,
             )
 
         if asset_name_refs:
-            asset_models_by_name = {key.name: am for key, am in asset_models.items()}
+            active_asset_keys_by_name = {key.name: key for key in active_asset_keys}
             asset_event_extras_by_name = {key.name: extra for key, extra in asset_event_extras.items()}
             for nref in asset_name_refs:
                 try:
-                    am = asset_models_by_name[nref.name]
+                    asset_key = active_asset_keys_by_name[nref.name]
                 except KeyError:
                     bad_asset_keys.add(nref)
                     continue
-                ti.log.debug("register event for asset name ref %s", am)
+                ti.log.debug("register event for asset name ref %s", asset_key)
                 asset_manager.register_asset_change(
                     task_instance=ti,
-                    asset=am,
+                    asset=asset_key,
                     extra=asset_event_extras_by_name.get(nref.name),
                     session=session,
                 )
         if asset_uri_refs:
-            asset_models_by_uri = {key.uri: am for key, am in asset_models.items()}
+            active_asset_keys_by_uri = {key.uri: key for key in active_asset_keys}
             asset_event_extras_by_uri = {key.uri: extra for key, extra in asset_event_extras.items()}
             for uref in asset_uri_refs:
                 try:
-                    am = asset_models_by_uri[uref.uri]
+                    asset_key = active_asset_keys_by_uri[uref.uri]
                 except KeyError:
                     bad_asset_keys.add(uref)
                     continue
-                ti.log.debug("register event for asset uri ref %s", am)
+                ti.log.debug("register event for asset uri ref %s", asset_key)
                 asset_manager.register_asset_change(
                     task_instance=ti,
-                    asset=am,
+                    asset=asset_key,
                     extra=asset_event_extras_by_uri.get(uref.uri),
                     session=session,
                 )
 
-        def _asset_event_extras_from_aliases() -> dict[tuple[AssetUniqueKey, frozenset], set[str]]:
-            d = defaultdict(set)
-            for event in outlet_events:
-                try:
-                    alias_name = event["source_alias_name"]
-                except KeyError:
-                    continue
-                if alias_name not in outlet_alias_names:
-                    continue
-                asset_key = AssetUniqueKey(**event["dest_asset_key"])
-                extra_key = frozenset(event["extra"].items())
-                d[asset_key, extra_key].add(alias_name)
-            return d
-
-        outlet_alias_names = {o.name for o in task_outlets if o.type == AssetAlias.__name__ and o.name}
-        if outlet_alias_names and (event_extras_from_aliases := _asset_event_extras_from_aliases()):
+        if event_extras_from_aliases:
             for (asset_key, extra_key), event_aliase_names in event_extras_from_aliases.items():
                 ti.log.debug("register event for asset %s with aliases %s", asset_key, event_aliase_names)
                 event = asset_manager.register_asset_change(
@@ -2779,8 +3003,7 @@ class TaskInstance(Base, LoggingMixin):
 
     def _execute_task_with_callbacks(self, context: Context, test_mode: bool = False, *, session: Session):
         """Prepare Task for Execution."""
-        from airflow.sdk.execution_time.callback_runner import create_executable_runner
-        from airflow.sdk.execution_time.context import context_get_outlet_events
+        import jinja2
 
         if TYPE_CHECKING:
             assert self.task
@@ -2839,7 +3062,7 @@ class TaskInstance(Base, LoggingMixin):
             # Log context only for the default execution method, the assumption
             # being that otherwise we're resuming a deferred task (in which
             # case there's no need to log these again).
-            if not self.next_method:
+            if not self.next_method and self.log.isEnabledFor(logging.INFO):
                 self.log.info(
                     "Exporting env vars: %s",
                     " ".join(f"{k}={v!r}" for k, v in airflow_context_vars.items()),
@@ -2934,7 +3157,7 @@ class TaskInstance(Base, LoggingMixin):
         """Functions that need to be run before a Task is executed."""
         if not (callbacks := task.on_execute_callback):
             return
-        for callback in callbacks if isinstance(callbacks, list) else [callbacks]:
+        for callback in callbacks if isinstance(callbacks, list) else (callbacks,):
             try:
                 callback(context)
             except Exception:
@@ -3109,8 +3332,6 @@ class TaskInstance(Base, LoggingMixin):
                 # If the task instance is in the running state, it means it raised an exception and
                 # about to retry so we record the task instance history. For other states, the task
                 # instance was cleared and already recorded in the task instance history.
-                from airflow.models.taskinstancehistory import TaskInstanceHistory
-
                 TaskInstanceHistory.record_ti(ti, session=session)
                 ti.try_id = uuid7()
 
@@ -3137,7 +3358,7 @@ class TaskInstance(Base, LoggingMixin):
     @provide_session
     def save_to_db(ti: TaskInstance, session: Session = NEW_SESSION):
         ti.updated_at = timezone.utcnow()
-        session.merge(ti)
+        _merge_if_detached(ti, session)
         session.flush()
         session.commit()
 
@@ -3159,13 +3380,9 @@ class TaskInstance(Base, LoggingMixin):
         :param context: Jinja2 context
         :param force_fail: if True, task does not retry
         """
-        if TYPE_CHECKING:
-            assert self.task
-            assert self.task.dag
-        try:
-            fail_fast = self.task.dag.fail_fast
-        except Exception:
-            fail_fast = False
+        task = getattr(self, "task", None)
+        dag = task.get_dag() if task is not None else None
+        fail_fast = getattr(dag, "fail_fast", False)
         _handle_failure(
             task_instance=self,
             error=error,
@@ -3208,7 +3425,7 @@ class TaskInstance(Base, LoggingMixin):
 
         If task has already run, will fetch from DB; otherwise will render.
         """
-        from airflow.models.renderedtifields import RenderedTaskInstanceFields
+        from jinja2 import TemplateAssertionError, UndefinedError
 
         if TYPE_CHECKING:
             assert isinstance(self.task, BaseOperator)
@@ -3252,16 +3469,27 @@ class TaskInstance(Base, LoggingMixin):
         the unmapped, fully rendered BaseOperator. The original ``self.task``
         before replacement is returned.
         """
+        from airflow.sdk.bases.operator import BaseOperator as TaskSDKBaseOperator
         from airflow.sdk.definitions.mappedoperator import MappedOperator
 
+        original_task = self.task
+        if TYPE_CHECKING:
+            assert original_task
+
+        # Nothing to render: skip building the context and the Jinja environment. Operators that
+        # override render_template_fields (and mapped operators, which unmap there) still go through it.
+        if (
+            not original_task.template_fields
+            and type(original_task).render_template_fields is TaskSDKBaseOperator.render_template_fields
+        ):
+            return original_task
+
         if not context:
             context = self.get_template_context()
-        original_task = self.task
 
         ti = context["ti"]
 
         if TYPE_CHECKING:
-            assert original_task
             assert self.task
             assert ti.task
 
@@ -3353,23 +3581,30 @@ class TaskInstance(Base, LoggingMixin):
     def get_num_running_task_instances(self, session: Session, same_dagrun: bool = False) -> int:
         """Return Number of running TIs from the DB."""
         # .count() is inefficient
-        num_running_task_instances_query = session.query(func.count()).filter(
-            TaskInstance.dag_id == self.dag_id,
-            TaskInstance.task_id == self.task_id,
-            TaskInstance.state == TaskInstanceState.RUNNING,
+        num_running_task_instances_query = (
+            select(func.count())
+            .select_from(TaskInstance)
+            .where(
+                TaskInstance.dag_id == self.dag_id,
+                TaskInstance.task_id == self.task_id,
+                TaskInstance.state == TaskInstanceState.RUNNING,
+            )
         )
         if same_dagrun:
-            num_running_task_instances_query = num_running_task_instances_query.filter(
+            num_running_task_instances_query = num_running_task_instances_query.where(
                 TaskInstance.run_id == self.run_id
             )
-        return num_running_task_instances_query.scalar()
+        return session.scalar(num_running_task_instances_query)
 
     @staticmethod
-    def filter_for_tis(tis: Iterable[TaskInstance | TaskInstanceKey]) -> BooleanClauseList | None:
+    def filter_for_tis(
+        tis: Iterable[TaskInstance | TaskInstanceKey],
+    ) -> BooleanClauseList | BinaryExpression | None:
         """Return SQLAlchemy filter to query selected task instances."""
         # DictKeys type, (what we often pass here from the scheduler) is not directly indexable :(
         # Or it might be a generator, but we need to be able to iterate over it more than once
-        tis = list(tis)
+        if not isinstance(tis, (list, tuple)):
+            tis = list(tis)
 
         if not tis:
             return None
@@ -3381,35 +3616,40 @@ class TaskInstance(Base, LoggingMixin):
         map_index = first.map_index
         first_task_id = first.task_id
 
-        # pre-compute the set of dag_id, run_id, map_indices and task_ids
-        dag_ids, run_ids, map_indices, task_ids = set(), set(), set(), set()
+        # find out which of dag_id, run_id, map_index and task_id are shared by all TIs. Every common
+        # path below needs the same dag_id and two of the other three, so stop as soon as that fails
+        same_dag = same_run = same_map = same_task = True
         for t in tis:
-            dag_ids.add(t.dag_id)
-            run_ids.add(t.run_id)
-            map_indices.add(t.map_index)
-            task_ids.add(t.task_id)
+            if t.dag_id != dag_id:
+                same_dag = False
+                break
+            same_run = same_run and t.run_id == run_id
+            same_map = same_map and t.map_index == map_index
+            same_task = same_task and t.task_id == first_task_id
+            if same_run + same_map + same_task < 2:
+                break
 
         # Common path optimisations: when all TIs are for the same dag_id and run_id, or same dag_id
         # and task_id -- this can be over 150x faster for huge numbers of TIs (20k+)
-        if dag_ids == {dag_id} and run_ids == {run_id} and map_indices == {map_index}:
+        if same_dag and same_run and same_map:
             return and_(
                 TaskInstance.dag_id == dag_id,
                 TaskInstance.run_id == run_id,
                 TaskInstance.map_index == map_index,
-                TaskInstance.task_id.in_(task_ids),
+                TaskInstance.task_id.in_({t.task_id for t in tis}),
             )
-        if dag_ids == {dag_id} and task_ids == {first_task_id} and map_indices == {map_index}:
+        if same_dag and same_task and same_map:
             return and_(
                 TaskInstance.dag_id == dag_id,
-                TaskInstance.run_id.in_(run_ids),
+                TaskInstance.run_id.in_({t.run_id for t in tis}),
                 TaskInstance.map_index == map_index,
                 TaskInstance.task_id == first_task_id,
             )
-        if dag_ids == {dag_id} and run_ids == {run_id} and task_ids == {first_task_id}:
+        if same_dag and same_run and same_task:
             return and_(
                 TaskInstance.dag_id == dag_id,
                 TaskInstance.run_id == run_id,
-                TaskInstance.map_index.in_(map_indices),
+                TaskInstance.map_index.in_({t.map_index for t in tis}),
                 TaskInstance.task_id == first_task_id,
             )
 
@@ -3423,10 +3663,10 @@ class TaskInstance(Base, LoggingMixin):
             map_index_groups[(t.dag_id, t.run_id)][t.map_index].append(t.task_id)
 
         # this assumes that most dags have dag_id as the largest grouping, followed by run_id. even
-        # if its not, this is still  a significant optimization over querying for every single tuple key
-        for cur_dag_id, cur_run_id in itertools.product(dag_ids, run_ids):
+        # if its not, this is still  a significant optimization over querying for every single tuple key.
+        # Only the (dag_id, run_id) pairs actually present are visited, not every combination of them.
+        for (cur_dag_id, cur_run_id), dag_task_id_groups in task_id_groups.items():
             # we compare the group size between task_id and map_index and use the smaller group
-            dag_task_id_groups = task_id_groups[(cur_dag_id, cur_run_id)]
             dag_map_index_groups = map_index_groups[(cur_dag_id, cur_run_id)]
 
             if len(dag_task_id_groups) <= len(dag_map_index_groups):
@@ -3450,6 +3690,13 @@ class TaskInstance(Base, LoggingMixin):
                         )
                     )
 
+        if len(filter_condition) >= len(tis):
+            # Grouping did not merge anything, so instead of an OR of one clause per task instance
+            # (slow to plan when there are thousands of them) match the keys with a single tuple IN.
+            return tuple_(
+                TaskInstance.dag_id, TaskInstance.run_id, TaskInstance.task_id, TaskInstance.map_index
+            ).in_([(t.dag_id, t.run_id, t.task_id, t.map_index) for t in tis])
+
         return or_(*filter_condition)
 
     @classmethod
@@ -3524,6 +3771,55 @@ class TaskInstance(Base, LoggingMixin):
         :return: Specific map index or map indexes to pull, or ``None`` if we
             want to "whole" return value (i.e. no mapped task groups involved).
         """
+        return self._get_relevant_upstream_map_indexes(upstream, ti_count, {}, session=session)
+
+    def get_relevant_upstream_map_indexes_bulk(
+        self,
+        upstreams: Iterable[Operator],
+        ti_count: int | None,
+        *,
+        session: Session,
+    ) -> dict[str, int | range | None]:
+        """
+        Infer the map indexes relevant to this ti for multiple upstreams.
+
+        This is equivalent to calling :meth:`get_relevant_upstream_map_indexes` for
+        each upstream, but the mapped ti count of each common mapped task group is
+        only looked up once.
+
+        :param upstreams: The referenced upstream tasks.
+        :param ti_count: The total count of task instance this task was expanded
+            by the scheduler, i.e. ``expanded_ti_count`` in the template context.
+        :return: Mapping of upstream task id to the value that
+            :meth:`get_relevant_upstream_map_indexes` would return for it.
+        """
+        from airflow.sdk.definitions.mappedoperator import MappedOperator
+
+        ancestor_ti_counts: dict[str, int] = {}
+        # A task that is not mapped itself is expanded exactly as often as its closest mapped
+        # task group, so that group's count is already known and needs no lookup.
+        if (
+            ti_count
+            and self.task
+            and not isinstance(self.task, MappedOperator)
+            and (group := self.task.get_closest_mapped_task_group()) is not None
+        ):
+            ancestor_ti_counts[group.group_id] = ti_count
+        return {
+            upstream.task_id: self._get_relevant_upstream_map_indexes(
+                upstream, ti_count, ancestor_ti_counts, session=session
+            )
+            for upstream in upstreams
+        }
+
+    def _get_relevant_upstream_map_indexes(
+        self,
+        upstream: Operator,
+        ti_count: int | None,
+        ancestor_ti_counts: dict[str, int],
+        *,
+        session: Session,
+    ) -> int | range | None:
         from airflow.models.baseoperator import BaseOperator
 
         if TYPE_CHECKING:
@@ -3549,7 +3845,12 @@ class TaskInstance(Base, LoggingMixin):
         # should use a "partial" value. Let's break down the mapped ti count
         # between the ancestor and further expansion happened inside it.
 
-        ancestor_ti_count = BaseOperator.get_mapped_ti_count(common_ancestor, self.run_id, session=session)
+        try:
+            ancestor_ti_count = ancestor_ti_counts[common_ancestor.group_id]
+        except KeyError:
+            ancestor_ti_count = ancestor_ti_counts[common_ancestor.group_id] = (
+                BaseOperator.get_mapped_ti_count(common_ancestor, self.run_id, session=session)
+            )
         ancestor_map_index = self.map_index * ancestor_ti_count // ti_count
 
         # If the task is NOT further expanded inside the common ancestor, we
@@ -3573,25 +3874,30 @@ class TaskInstance(Base, LoggingMixin):
 
         :meta private:
         """
-        from airflow.models.renderedtifields import RenderedTaskInstanceFields
-
         tables: list[type[TaskInstanceDependencies]] = [
             XComModel,
             RenderedTaskInstanceFields,
             TaskMap,
         ]
-        tables_by_id: list[type[Base]] = [TaskInstanceNote, TaskReschedule]
+        # Rows of these tables are not held in the session by this code path, so there is nothing to
+        # synchronize. The note is an ORM relationship of the task instance and may well be loaded.
         for table in tables:
             session.execute(
-                delete(table).where(
+                delete(table)
+                .where(
                     table.dag_id == self.dag_id,
                     table.task_id == self.task_id,
                     table.run_id == self.run_id,
                     table.map_index == self.map_index,
                 )
+                .execution_options(synchronize_session=False)
             )
-        for table in tables_by_id:
-            session.execute(delete(table).where(table.ti_id == self.id))
+        session.execute(
+            delete(TaskReschedule)
+            .where(TaskReschedule.ti_id == self.id)
+            .execution_options(synchronize_session=False)
+        )
+        session.execute(delete(TaskInstanceNote).where(TaskInstanceNote.ti_id == self.id))
 
     @classmethod
     def duration_expression_update(
@@ -3659,7 +3965,7 @@ class TaskInstance(Base, LoggingMixin):
             for name, uri in session.execute(
                 select(AssetActive.name, AssetActive.uri).where(
                     tuple_(AssetActive.name, AssetActive.uri).in_(
-                        attrs.astuple(key) for key in asset_unique_keys
+                        [(key.name, key.uri) for key in asset_unique_keys]
                     )
                 )
             )
@@ -3797,10 +4103,9 @@ class SimpleTaskInstance:
             key=ti.key,
             run_as_user=ti.run_as_user if hasattr(ti, "run_as_user") else None,
             priority_weight=ti.priority_weight if hasattr(ti, "priority_weight") else None,
-            # Inspect the ti, to check if the 'dag_run' relationship is loaded.
-            parent_context_carrier=ti.dag_run.context_carrier
-            if "dag_run" not in inspect(ti).unloaded
-            else None,
+            # Only read the 'dag_run' relationship if it is already loaded (i.e. in the instance dict),
+            # which is cheaper than building the set of all unloaded attributes with inspect().
+            parent_context_carrier=ti.dag_run.context_carrier if "dag_run" in ti.__dict__ else None,
             context_carrier=ti.context_carrier if hasattr(ti, "context_carrier") else None,
             span_status=ti.span_status,
         )
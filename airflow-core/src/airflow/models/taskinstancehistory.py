@@ -29,8 +29,10 @@ from sqlalchemy import (
     String,
     UniqueConstraint,
     func,
+    insert,
     select,
     text,
+    tuple_,
 )
 from sqlalchemy.dialects import postgresql
 from sqlalchemy.ext.mutable import MutableDict
@@ -39,6 +41,7 @@ from sqlalchemy_utils import UUIDType
 
 from airflow.models.base import Base, StringID
 from airflow.utils import timezone
+from airflow.utils.helpers import chunks
 from airflow.utils.session import NEW_SESSION, provide_session
 from airflow.utils.span_status import SpanStatus
 from airflow.utils.sqlalchemy import (
@@ -49,10 +52,14 @@ from airflow.utils.sqlalchemy import (
 from airflow.utils.state import State, TaskInstanceState
 
 if TYPE_CHECKING:
+    from collections.abc import Iterable
+
     from sqlalchemy.orm.session import Session
 
     from airflow.models.taskinstance import TaskInstance
 
+_RECORD_TIS_CHUNK_SIZE = 500
+
 
 class TaskInstanceHistory(Base):
     """
@@ -174,3 +181,54 @@ class TaskInstanceHistory(Base):
             ti.set_duration()
         ti_history = TaskInstanceHistory(ti, state=ti_history_state)
         session.add(ti_history)
+
+    @staticmethod
+    def record_tis(tis: Iterable[TaskInstance], session: Session) -> None:
+        """
+        Record multiple TaskInstances to TaskInstanceHistory.
+
+        This behaves like calling :meth:`record_ti` for each task instance, but looks up
+        already recorded tries and inserts the new rows with one query and one executemany
+        per chunk of task instances.
+        """
+        columns = [column.name for column in TaskInstanceHistory.__table__.columns if column.name != "id"]
+        recorded: set[tuple] = set()
+        # Each task instance adds five bind parameters to the lookup, so it is run in chunks to stay
+        # below the database's placeholder limit when a large number of task instances is cleared.
+        for tis_chunk in chunks(list(tis), _RECORD_TIS_CHUNK_SIZE):
+            try_keys = {(ti.dag_id, ti.task_id, ti.run_id, ti.map_index, ti.try_number) for ti in tis_chunk}
+            recorded.update(
+                session.execute(
+                    select(
+                        TaskInstanceHistory.dag_id,
+                        TaskInstanceHistory.task_id,
+                        TaskInstanceHistory.run_id,
+                        TaskInstanceHistory.map_index,
+                        TaskInstanceHistory.try_number,
+                    ).where(
+                        tuple_(
+                            TaskInstanceHistory.dag_id,
+                            TaskInstanceHistory.task_id,
+                            TaskInstanceHistory.run_id,
+                            TaskInstanceHistory.map_index,
+                            TaskInstanceHistory.try_number,
+                        ).in_(try_keys)
+                    )
+                )
+            )
+            rows = []
+            for ti in tis_chunk:
+                key = (ti.dag_id, ti.task_id, ti.run_id, ti.map_index, ti.try_number)
+                if key in recorded:
+                    continue
+                recorded.add(key)
+                ti_history_state = ti.state
+                if ti.state not in State.finished:
+                    ti_history_state = TaskInstanceState.FAILED
+                    ti.end_date = timezone.utcnow()
+                    ti.set_duration()
+                row = {name: ti.id if name == "task_instance_id" else getattr(ti, name) for name in columns}
+                row["state"] = ti_history_state
+                rows.append(row)
+            if rows:
+                session.execute(insert(TaskInstanceHistory), rows)
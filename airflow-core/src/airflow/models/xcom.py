@@ -142,13 +142,12 @@ class XComModel(TaskInstanceDependencies):
         if not run_id:
             raise ValueError(f"run_id must be passed. Passed run_id={run_id}")
 
-        query = session.query(cls).filter_by(dag_id=dag_id, task_id=task_id, run_id=run_id)
+        query = delete(cls).where(cls.dag_id == dag_id, cls.task_id == task_id, cls.run_id == run_id)
         if map_index is not None:
-            query = query.filter_by(map_index=map_index)
+            query = query.where(cls.map_index == map_index)
 
-        for xcom in query:
-            # print(f"Clearing XCOM {xcom} with value {xcom.value}")
-            session.delete(xcom)
+        # A single DELETE rather than loading and deleting each XCom row through the ORM.
+        session.execute(query)
 
         session.commit()
 
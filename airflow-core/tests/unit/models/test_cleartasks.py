@@ -19,6 +19,7 @@ from __future__ import annotations
 
 import datetime
 import random
+from unittest import mock
 
 import pytest
 from sqlalchemy import select
@@ -125,6 +126,76 @@ class TestClearTasks:
             assert ti0.state is None
             assert ti0.external_executor_id is None
 
+    def test_clear_task_instances_with_dag_does_not_load_dagbag(self, dag_maker):
+        with dag_maker(
+            "test_clear_task_instances_with_dag_does_not_load_dagbag",
+            start_date=DEFAULT_DATE,
+            end_date=DEFAULT_DATE + datetime.timedelta(days=10),
+        ) as dag:
+            EmptyOperator(task_id="task0")
+            EmptyOperator(task_id="task1", retries=2)
+
+        dr = dag_maker.create_dagrun(state=State.RUNNING, run_type=DagRunType.SCHEDULED)
+        for ti in dr.task_instances:
+            ti.state = State.SUCCESS
+
+        with create_session() as session:
+            for ti in dr.task_instances:
+                session.merge(ti)
+            session.commit()
+
+            qry = session.query(TI).filter(TI.dag_id == dag.dag_id).order_by(TI.task_id).all()
+            with mock.patch("airflow.models.taskinstance.DagBag") as mock_dag_bag:
+                clear_task_instances(qry, session, dag=dag)
+            mock_dag_bag.assert_not_called()
+
+            ti0, ti1 = session.query(TI).filter(TI.dag_id == dag.dag_id).order_by(TI.task_id).all()
+            assert ti0.state is None
+            assert ti0.max_tries == 0
+            assert ti1.state is None
+            assert ti1.max_tries == 2
+
+    def test_clear_task_instances_records_each_try_once(self, dag_maker):
+        with dag_maker("test_clear_task_instances_records_each_try_once", start_date=DEFAULT_DATE) as dag:
+            EmptyOperator(task_id="0")
+            EmptyOperator(task_id="1")
+        dr = dag_maker.create_dagrun(state=DagRunState.SUCCESS, run_type=DagRunType.SCHEDULED)
+        session = dag_maker.session
+        for ti in dr.task_instances:
+            ti.state = TaskInstanceState.SUCCESS
+        session.flush()
+
+        tis = session.query(TI).filter(TI.dag_id == dag.dag_id).all()
+        TaskInstanceHistory.record_tis(tis, session)
+        clear_task_instances(tis, session, dag=dag)
+        session.flush()
+
+        # The tries were already recorded, so clearing must not insert them again
+        assert session.query(TaskInstanceHistory).count() == 2
+        assert {h.state for h in session.query(TaskInstanceHistory)} == {TaskInstanceState.SUCCESS}
+
+    def test_clear_task_instances_records_history_in_chunks(self, dag_maker):
+        with dag_maker("test_clear_task_instances_records_history_in_chunks", start_date=DEFAULT_DATE) as dag:
+            for i in range(5):
+                EmptyOperator(task_id=str(i))
+        dr = dag_maker.create_dagrun(state=DagRunState.SUCCESS, run_type=DagRunType.SCHEDULED)
+        session = dag_maker.session
+        for ti in dr.task_instances:
+            ti.state = TaskInstanceState.SUCCESS
+        session.flush()
+
+        tis = session.query(TI).filter(TI.dag_id == dag.dag_id).all()
+        # Record one try up front, so the chunks must also skip tries recorded before the clear
+        TaskInstanceHistory.record_ti(tis[0], session=session)
+        session.flush()
+        with mock.patch("airflow.models.taskinstancehistory._RECORD_TIS_CHUNK_SIZE", 2):
+            clear_task_instances(tis, session, dag=dag)
+        session.flush()
+
+        history = session.query(TaskInstanceHistory).all()
+        assert sorted(h.task_id for h in history) == ["0", "1", "2", "3", "4"]
+        assert {h.state for h in history} == {TaskInstanceState.SUCCESS}
+
     def test_clear_task_instances_next_method(self, dag_maker, session):
         with dag_maker(
             "test_clear_task_instances_next_method",
@@ -1306,6 +1306,26 @@ def test_expand_mapped_task_instance_at_create(is_noop, dag_maker, session):
         assert indices == [(0,), (1,), (2,), (3,)]
 
 
+def test_expand_mapped_task_instance_at_create_priority_weight(dag_maker, session):
+    with mock.patch("airflow.settings.task_instance_mutation_hook") as mock_mut:
+        mock_mut.is_noop = True
+        with dag_maker(session=session, dag_id="test_dag"):
+            mapped = MockOperator.partial(task_id="task_2", priority_weight=3).expand(arg2=[1, 2, 3])
+            MockOperator(task_id="task_3", priority_weight=2) << mapped
+
+        with mock.patch.object(TI, "insert_mapping", side_effect=TI.insert_mapping) as insert:
+            dr = dag_maker.create_dagrun()
+        weights = (
+            session.query(TI.priority_weight)
+            .filter_by(task_id=mapped.task_id, dag_id=mapped.dag_id, run_id=dr.run_id)
+            .all()
+        )
+        assert weights == [(5,), (5,), (5,)]
+        # The weight is only computed for the first expanded task instance
+        precomputed = [c for c in insert.call_args_list if c.args[1].task_id == mapped.task_id]
+        assert [c.kwargs["priority_weight"] for c in precomputed] == [None, 5, 5]
+
+
 @pytest.mark.parametrize("is_noop", [True, False])
 def test_expand_mapped_task_instance_task_decorator(is_noop, dag_maker, session):
     with mock.patch("airflow.settings.task_instance_mutation_hook") as mock_mut:
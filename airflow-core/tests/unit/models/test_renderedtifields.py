@@ -32,6 +32,7 @@ from airflow import settings
 from airflow.configuration import conf
 from airflow.models import DagRun, Variable
 from airflow.models.renderedtifields import RenderedTaskInstanceFields as RTIF
+from airflow.models.taskinstance import _update_rtif
 from airflow.models.taskmap import TaskMap
 from airflow.providers.standard.operators.bash import BashOperator
 from airflow.providers.standard.operators.python import PythonOperator
@@ -401,6 +402,42 @@ class TestRenderedTaskInstanceFields:
                 "cwd": "val 3",
             }
 
+    def test_update_rtif_prunes_only_on_first_try(self, dag_maker, session):
+        """
+        A retry rewrites the row of its task instance, so old records are only pruned on the
+        first try, and the number of rows kept stays bounded across retries.
+        """
+        with dag_maker("test_update_rtif_prunes_only_on_first_try", session=session) as dag:
+            task = BashOperator(task_id="test", bash_command="echo {{ ds }}")
+
+        delete_old_records = RTIF.delete_old_records
+
+        def keep_two(task_id, dag_id, session):
+            delete_old_records(task_id=task_id, dag_id=dag_id, num_to_keep=2, session=session)
+
+        with mock.patch.object(RTIF, "delete_old_records", side_effect=keep_two) as mock_delete:
+            for num in range(4):
+                dr = dag_maker.create_dagrun(
+                    run_id=f"run_{num}", logical_date=dag.start_date + timedelta(days=num)
+                )
+                ti = dr.task_instances[0]
+                ti.task = task
+
+                ti.try_number = 1
+                _update_rtif(ti, {"bash_command": f"echo run {num} try 1"}, session=session)
+                assert mock_delete.call_count == num + 1
+
+                ti.try_number = 2
+                _update_rtif(ti, {"bash_command": f"echo run {num} try 2"}, session=session)
+                assert mock_delete.call_count == num + 1
+
+                result = session.scalars(
+                    select(RTIF).where(RTIF.dag_id == dag.dag_id, RTIF.task_id == task.task_id)
+                ).all()
+                assert len(result) == min(num + 1, 2)
+                rtif = next(rtif for rtif in result if rtif.run_id == dr.run_id)
+                assert rtif.rendered_fields == {"bash_command": f"echo run {num} try 2"}
+
     def test_rtif_deletion_stale_data_error(self, dag_maker, session):
         """
         Here we verify bad behavior.  When we rerun a task whose RTIF
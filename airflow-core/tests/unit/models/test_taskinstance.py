@@ -37,6 +37,7 @@ import pytest
 import time_machine
 import uuid6
 from sqlalchemy import delete, select
+from sqlalchemy.sql.elements import BinaryExpression
 
 from airflow import settings
 from airflow.exceptions import (
@@ -46,6 +47,7 @@ from airflow.exceptions import (
     AirflowRescheduleException,
     AirflowSkipException,
     AirflowTaskTerminated,
+    TaskDeferred,
     UnmappableXComLengthPushed,
     UnmappableXComTypePushed,
     XComForMappingNotPushed,
@@ -64,16 +66,20 @@ from airflow.models.taskinstance import (
     TaskInstance as TI,
     TaskInstanceNote,
     _run_finished_callback,
+    _stop_remaining_tasks,
 )
 from airflow.models.taskinstancehistory import TaskInstanceHistory
+from airflow.models.taskinstancekey import TaskInstanceKey
 from airflow.models.taskmap import TaskMap
 from airflow.models.taskreschedule import TaskReschedule
+from airflow.models.trigger import Trigger
 from airflow.models.variable import Variable
 from airflow.models.xcom import XComModel
 from airflow.providers.standard.operators.bash import BashOperator
 from airflow.providers.standard.operators.empty import EmptyOperator
 from airflow.providers.standard.operators.python import PythonOperator
 from airflow.providers.standard.sensors.python import PythonSensor
+from airflow.providers.standard.triggers.temporal import TimeDeltaTrigger
 from airflow.sdk import BaseSensorOperator, task, task_group
 from airflow.sdk.api.datamodels._generated import AssetEventResponse, AssetResponse
 from airflow.sdk.bases.notifier import BaseNotifier
@@ -791,6 +797,30 @@ class TestTaskInstance:
         date = ti.next_retry_datetime()
         assert date == ti.end_date + max_delay
 
+    @pytest.mark.parametrize(
+        "try_number, expected_seconds",
+        [(1, 47), (2, 63), (3, 225), (4, 410)],
+    )
+    def test_next_retry_datetime_pinned_values(self, dag_maker, try_number, expected_seconds):
+        """The backoff jitter is derived from the task instance key; changing it reschedules waiting retries."""
+        with dag_maker(dag_id="backoff_dag"):
+            task = BashOperator(
+                task_id="backoff_task",
+                bash_command="exit 1",
+                retries=5,
+                retry_delay=datetime.timedelta(seconds=30),
+                retry_exponential_backoff=True,
+            )
+        ti = dag_maker.create_dagrun().task_instances[0]
+        ti.task = task
+        ti.try_number = try_number
+        ti.end_date = timezone.datetime(2021, 1, 2)
+
+        logical_date = datetime.datetime(2021, 1, 1, tzinfo=datetime.timezone.utc)
+        with mock.patch.object(TI, "logical_date", logical_date):
+            date = ti.next_retry_datetime()
+        assert date == ti.end_date + datetime.timedelta(seconds=expected_seconds)
+
     @pytest.mark.parametrize("seconds", [0, 0.5, 1])
     def test_next_retry_datetime_short_or_zero_intervals(self, dag_maker, seconds):
         delay = datetime.timedelta(seconds=seconds)
@@ -1974,6 +2004,14 @@ class TestTaskInstance:
         )
         assert ti.log_url == expected_url
 
+    def test_log_url_follows_base_url_override(self, create_task_instance):
+        ti = create_task_instance(dag_id="my_dag", task_id="op", logical_date=timezone.datetime(2018, 1, 1))
+
+        assert ti.log_url.startswith("http://localhost:8080/dags/my_dag/grid")
+        with conf_vars({("webserver", "base_url"): "https://airflow.example.com"}):
+            assert ti.log_url.startswith("https://airflow.example.com/dags/my_dag/grid")
+            assert ti.mark_success_url.startswith("https://airflow.example.com/confirm")
+
     def test_mark_success_url(self, create_task_instance):
         now = pendulum.now("Europe/Brussels")
         ti = create_task_instance(dag_id="dag", task_id="op", logical_date=now)
@@ -3688,6 +3726,35 @@ class TestTaskInstance:
         for i in range(len(states)):
             assert tasks[i].state == exp_states[i]
 
+    def test_stop_remaining_tasks_commits_once(self, dag_maker, session):
+        with dag_maker("test_stop_remaining_tasks_commits_once", fail_fast=True, session=session):
+            failing = EmptyOperator(task_id="failing")
+            for i in range(3):
+                EmptyOperator(task_id=f"running_{i}")
+            for i in range(2):
+                EmptyOperator(task_id=f"scheduled_{i}")
+        dr = dag_maker.create_dagrun()
+        tis = {ti.task_id: ti for ti in dr.get_task_instances(session=session)}
+        for task_id, ti in tis.items():
+            ti.state = State.RUNNING if task_id.startswith("running") else State.SCHEDULED
+        tis["failing"].state = State.FAILED
+        tis["failing"].task = failing
+        session.flush()
+
+        with mock.patch.object(session, "commit", wraps=session.commit) as mock_commit:
+            _stop_remaining_tasks(task_instance=tis["failing"], session=session)
+        mock_commit.assert_called_once()
+
+        session.expire_all()
+        assert {ti.task_id: ti.state for ti in dr.get_task_instances(session=session)} == {
+            "failing": State.FAILED,
+            "running_0": State.FAILED,
+            "running_1": State.FAILED,
+            "running_2": State.FAILED,
+            "scheduled_0": State.SKIPPED,
+            "scheduled_1": State.SKIPPED,
+        }
+
     def test_does_not_retry_on_airflow_fail_exception(self, dag_maker):
         def fail():
             raise AirflowFailException("hopeless")
@@ -3882,6 +3949,52 @@ class TestTaskInstance:
         assert call("ti.start", tags={"dag_id": ti.dag_id, "task_id": ti.task_id}) in stats_mock.mock_calls
         assert stats_mock.call_count == (2 * len(State.task_states)) + 7
 
+    @patch.object(Stats, "incr")
+    @conf_vars({("metrics", "emit_legacy_ti_metrics"): "False"})
+    def test_task_stats_without_legacy_metrics(self, stats_mock, create_task_instance):
+        ti = create_task_instance(
+            dag_id="test_task_start_end_stats_without_legacy_metrics",
+            end_date=timezone.utcnow() + datetime.timedelta(days=10),
+            state=State.RUNNING,
+        )
+        stats_mock.reset_mock()
+
+        session = settings.Session()
+        session.merge(ti)
+        session.commit()
+        ti._run_raw_task()
+        ti.refresh_from_db()
+        legacy_prefixes = (f"ti.start.{ti.dag_id}.", f"ti.finish.{ti.dag_id}.")
+        assert not [c for c in stats_mock.mock_calls if c.args[0].startswith(legacy_prefixes)]
+        stats_mock.assert_any_call(
+            "ti.finish",
+            tags={"dag_id": ti.dag_id, "task_id": ti.task_id, "state": ti.state},
+        )
+        assert call("ti.start", tags={"dag_id": ti.dag_id, "task_id": ti.task_id}) in stats_mock.mock_calls
+        assert stats_mock.call_count == len(State.task_states) + 5
+
+    @pytest.mark.parametrize("skip_preempt_check", [False, True])
+    def test_run_raw_task_preempt_check_on_completion(self, skip_preempt_check, create_task_instance):
+        ti = create_task_instance(
+            dag_id="test_run_raw_task_preempt_check_on_completion",
+            state=State.RUNNING,
+        )
+        session = settings.Session()
+        session.merge(ti)
+        session.commit()
+
+        with (
+            conf_vars({("core", "skip_preempt_check_on_completion"): str(skip_preempt_check)}),
+            mock.patch.object(
+                TI, "refresh_from_db", autospec=True, side_effect=TI.refresh_from_db
+            ) as refresh,
+        ):
+            ti._run_raw_task()
+
+        locked = [c for c in refresh.call_args_list if c.kwargs.get("lock_for_update")]
+        assert bool(locked) is not skip_preempt_check
+        assert ti.state == State.SUCCESS
+
     def test_command_as_list(self, dag_maker):
         with dag_maker():
             PythonOperator(python_callable=print, task_id="hi")
@@ -3959,6 +4072,32 @@ class TestTaskInstance:
         assert ti.start_date < ti.end_date
         assert ti.duration > 0
 
+    def test_defer_task_when_session_holds_another_copy(self, create_task_instance, session):
+        """Deferring must work when the session already has its own copy of the task instance."""
+        ti = create_task_instance(state=State.RUNNING, session=session)
+        session.commit()
+        # Detach our copy and load a different one for the same row into the session, as
+        # happens after a refresh_from_db or merge elsewhere in the same session.
+        session.expunge(ti)
+        session_ti = session.get(TaskInstance, ti.id)
+        assert session_ti is not ti
+
+        ti.defer_task(
+            exception=TaskDeferred(
+                trigger=TimeDeltaTrigger(datetime.timedelta(hours=1)), method_name="execute_complete"
+            ),
+            session=session,
+        )
+
+        session.expire_all()
+        ti_in_db = session.get(TaskInstance, ti.id)
+        assert ti_in_db.state == State.DEFERRED
+        assert ti_in_db.next_method == "execute_complete"
+        assert ti_in_db.trigger_id is not None
+        assert ti_in_db.trigger_id == ti.trigger_id
+        trigger = session.get(Trigger, ti_in_db.trigger_id)
+        assert trigger.classpath == "airflow.providers.standard.triggers.temporal.DateTimeTrigger"
+
     def test_refresh_from_db(self, create_task_instance):
         run_date = timezone.utcnow()
         hybrid_props = ["rendered_map_index", "task_display_name"]
@@ -5021,3 +5160,63 @@ def test__refresh_from_db_should_not_increment_try_number(dag_maker, session):
     assert ti.try_number == 1  # stays 1
     ti.refresh_from_db()
     assert ti.try_number == 1  # stays 1
+
+
+def test_filter_for_tis_without_shared_grouping(dag_maker, session):
+    with dag_maker("test_filter_for_tis_without_shared_grouping", schedule="@daily", session=session):
+        task_a = EmptyOperator(task_id="a")
+        task_b = EmptyOperator(task_id="b")
+    dr1 = dag_maker.create_dagrun()
+    dr2 = dag_maker.create_dagrun_after(dr1, run_type=DagRunType.SCHEDULED)
+    # Add mapped rows next to the unmapped ones, so map_index -1 and 0 exist for both tasks and runs.
+    for dr in (dr1, dr2):
+        for op in (task_a, task_b):
+            session.add(TI(task=op, run_id=dr.run_id, map_index=0))
+    session.flush()
+
+    # Neither run_id, task_id nor map_index is shared, and no two keys fall in the same group.
+    keys = [
+        TaskInstanceKey(dag_id=dr1.dag_id, task_id="a", run_id=dr1.run_id, map_index=-1),
+        TaskInstanceKey(dag_id=dr2.dag_id, task_id="b", run_id=dr2.run_id, map_index=0),
+    ]
+    condition = TI.filter_for_tis(keys)
+    assert isinstance(condition, BinaryExpression)
+
+    selected = session.scalars(select(TI).where(condition)).all()
+    assert sorted(ti.key.primary for ti in selected) == sorted(key.primary for key in keys)
+
+
+@pytest.mark.parametrize("map_index", [0, 1, 2])
+@pytest.mark.parametrize(
+    "upstream_ids",
+    [
+        pytest.param(["outside"], id="unmapped"),
+        pytest.param(["outside_mapped"], id="mapped"),
+        pytest.param(["tg.in_group"], id="in-mapped-group"),
+        pytest.param(["tg.in_group_mapped"], id="mapped-in-mapped-group"),
+        pytest.param(["outside", "outside_mapped", "tg.in_group", "tg.in_group_mapped"], id="all"),
+    ],
+)
+def test_get_relevant_upstream_map_indexes_bulk(dag_maker, session, upstream_ids, map_index):
+    with dag_maker("test_get_relevant_upstream_map_indexes_bulk", session=session) as dag:
+        EmptyOperator(task_id="outside")
+        MockOperator.partial(task_id="outside_mapped").expand(arg1=[1, 2])
+
+        @task_group
+        def tg(arg):
+            EmptyOperator(task_id="in_group")
+            MockOperator.partial(task_id="in_group_mapped").expand(arg2=[1, 2])
+            MockOperator(task_id="target", arg1=arg)
+
+        tg.expand(arg=[1, 2, 3])
+
+    dr = dag_maker.create_dagrun()
+    ti = TI(task=dag.get_task("tg.target"), run_id=dr.run_id, map_index=map_index)
+    upstreams = [dag.get_task(upstream_id) for upstream_id in upstream_ids]
+    ti_count = 3
+
+    expected = {
+        upstream.task_id: ti.get_relevant_upstream_map_indexes(upstream, ti_count, session=session)
+        for upstream in upstreams
+    }
+    assert ti.get_relevant_upstream_map_indexes_bulk(upstreams, ti_count, session=session) == expected